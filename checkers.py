@@ -1,10 +1,10 @@
 from __future__ import annotations
 
 import argparse
-from copy import deepcopy
+import random
 import sys
 import time
-from typing import Optional
+from typing import NamedTuple, Optional
 
 WIDTH = 8
 HEIGHT = 8
@@ -15,245 +15,337 @@ BLACK_PIECE = "b"
 BLACK_KING = "B"
 EMPTY_SQUARE = "."
 
+OPP_PIECE = {RED_PIECE: BLACK_PIECE, BLACK_PIECE: RED_PIECE}
+
 MIN_UTILITY = -1000000000
 MAX_UTILITY = 1000000000
 
-cached = {}  # for state caching
+# evaluation weights: a piece is worth 1, a king KING_WEIGHT, plus a bonus for standing in the center or on an edge
+KING_WEIGHT = 2
+CENTER_WEIGHT = 0.5
+EDGE_WEIGHT = 0.15
+
+CACHE_SIZE = 1 << 20  # number of state cache slots, a power of two
+cached = [None] * CACHE_SIZE  # for state caching, slot chosen by the low bits of the zobrist hash
+history = {}  # for move ordering, (from square, to square) -> how often and how deep the move caused a cutoff
+
+# what a cached value is known to be, relative to the true minimax value of the state
+EXACT = 0
+LOWER_BOUND = 1  # search failed high, true value >= v
+UPPER_BOUND = 2  # search failed low, true value <= v
 
 DEPTH_LIMIT = 9
 
+killers = [()] * (DEPTH_LIMIT + 1)  # for move ordering, the last two simple moves to cause a cutoff at each depth
+
+# Directions are bit offsets on a board whose square (y, x) is bit y * WIDTH + x
+UP_LEFT = -WIDTH - 1
+UP_RIGHT = -WIDTH + 1
+DOWN_LEFT = WIDTH - 1
+DOWN_RIGHT = WIDTH + 1
+
+RED_PIECE_DIRS = (UP_LEFT, UP_RIGHT)
+BLACK_PIECE_DIRS = (DOWN_LEFT, DOWN_RIGHT)
+KING_DIRS = (UP_LEFT, UP_RIGHT, DOWN_LEFT, DOWN_RIGHT)
+PIECE_DIRS_BY_TURN = {RED_PIECE: RED_PIECE_DIRS, BLACK_PIECE: BLACK_PIECE_DIRS}
+
+
+def _mask(predicate) -> int:
+    # bitboard of every square (y, x) for which predicate(y, x) holds
+    return sum(1 << (i * WIDTH + j) for i in range(HEIGHT) for j in range(WIDTH) if predicate(i, j))
+
+
+FULL_MASK = _mask(lambda i, j: True)
+FILE_A = _mask(lambda i, j: j == 0)
+FILE_H = _mask(lambda i, j: j == WIDTH - 1)
+EDGE_MASK = FILE_A | FILE_H
+CENTER_MASK = _mask(lambda i, j: (2 <= i <= 5 and 3 <= j <= 4) or (2 <= j <= 5 and 3 <= i <= 4))
+RED_KING_ROW = _mask(lambda i, j: i == 0)
+BLACK_KING_ROW = _mask(lambda i, j: i == HEIGHT - 1)
+KING_ROW = {RED_PIECE: RED_KING_ROW, BLACK_PIECE: BLACK_KING_ROW}  # where each player's pieces are promoted
+
+# a step to the left must not wrap onto the rightmost file of the neighbouring row, and vice versa
+SHIFT_MASK = {
+    UP_LEFT: FULL_MASK & ~FILE_H,
+    UP_RIGHT: FULL_MASK & ~FILE_A,
+    DOWN_LEFT: FULL_MASK & ~FILE_H,
+    DOWN_RIGHT: FULL_MASK & ~FILE_A,
+}
+
+
+# zobrist keys for every (piece type, square), in Board field order, plus one for black being next to move
+_zobrist_random = random.Random(0)
+ZOBRIST = tuple([_zobrist_random.getrandbits(64) for _ in range(WIDTH * HEIGHT)] for _ in range(4))
+ZOBRIST_TURN = _zobrist_random.getrandbits(64)
+# a state is cached separately as a min node: its value there is from the other player's point of view
+ZOBRIST_MIN_NODE = _zobrist_random.getrandbits(64)
+# (men, kings, opponent men, opponent kings) keys from the point of view of each player
+ZOBRIST_SIDES = {
+    RED_PIECE: (ZOBRIST[0], ZOBRIST[1], ZOBRIST[2], ZOBRIST[3]),
+    BLACK_PIECE: (ZOBRIST[2], ZOBRIST[3], ZOBRIST[0], ZOBRIST[1]),
+}
+
+
+def _shift(bits, direction) -> int:
+    # moves every square in bits one step in direction, dropping squares that leave the board
+    return (bits << direction if direction > 0 else bits >> -direction) & SHIFT_MASK[direction]
+
+
+def _square(bit) -> int:
+    # index of the single square set in bit
+    return bit.bit_length() - 1
+
+
+def _jumps_from(square, directions) -> tuple[tuple[int, int], ...]:
+    # (square jumped over, square landed on) for every jump from square in directions that stays on the board
+    i, j = divmod(square, WIDTH)
+    jumps = []
+    for direction in directions:
+        y, x = (-1 if direction < 0 else 1), (-1 if direction in (UP_LEFT, DOWN_LEFT) else 1)
+        if 0 <= i + 2 * y < HEIGHT and 0 <= j + 2 * x < WIDTH:
+            jumps.append((square + direction, square + 2 * direction))
+    return tuple(jumps)
+
+
+# jumps available from each square, so move generation never has to bounds check
+PIECE_JUMPS = {
+    turn: [_jumps_from(square, piece_dirs) for square in range(WIDTH * HEIGHT)]
+    for turn, piece_dirs in PIECE_DIRS_BY_TURN.items()
+}
+KING_JUMPS = [_jumps_from(square, KING_DIRS) for square in range(WIDTH * HEIGHT)]
+
+
+class Board(NamedTuple):
+    # This class is used to represent the pieces on a board, one 64-bit bitboard per piece type.
+    rm: int  # red pieces
+    rk: int  # red kings
+    bm: int  # black pieces
+    bk: int  # black kings
+
+    @classmethod
+    def from_squares(cls, squares) -> Board:
+        # squares : a flat bytearray of the 8*8 board, where square (y, x) is squares[y * WIDTH + x]
+        bitboards = dict.fromkeys(map(ord, (RED_PIECE, RED_KING, BLACK_PIECE, BLACK_KING)), 0)
+        for square, piece in enumerate(squares):
+            if piece in bitboards:
+                bitboards[piece] |= 1 << square
+        return cls(*bitboards.values())
+
+    @classmethod
+    def from_sides(cls, turn, men, kings, opp_men, opp_kings) -> Board:
+        # inverse of sides()
+        return cls(men, kings, opp_men, opp_kings) if turn == RED_PIECE else cls(opp_men, opp_kings, men, kings)
+
+    def sides(self, turn) -> tuple[int, int, int, int]:
+        # (men, kings, opponent men, opponent kings) from the point of view of turn
+        return (self.rm, self.rk, self.bm, self.bk) if turn == RED_PIECE else (self.bm, self.bk, self.rm, self.rk)
+
+    def zobrist_hash(self, next_turn) -> int:
+        zhash = ZOBRIST_TURN if next_turn == BLACK_PIECE else 0
+        for keys, bits in zip(ZOBRIST, self):
+            while bits:
+                zhash ^= keys[_square(bits & -bits)]
+                bits &= bits - 1
+        return zhash
+
+    def to_squares(self) -> bytearray:
+        # inverse of from_squares()
+        squares = bytearray(EMPTY_SQUARE * (WIDTH * HEIGHT), "ascii")
+        for piece, bits in zip(map(ord, (RED_PIECE, RED_KING, BLACK_PIECE, BLACK_KING)), self):
+            while bits:
+                squares[_square(bits & -bits)] = piece
+                bits &= bits - 1
+        return squares
+
+
+# a move as generated by the search: (from square, to square, board after the move, zobrist hash after the move)
+Move = tuple[int, int, Board, int]
+
 
 class State:
     # This class is used to represent a state.
-    # board : a list of lists that represents the 8*8 board
-    board: list[list[str]]  # index into position (x,y) by board[y][x]
+    # board : the bitboards of the 8*8 board
+    # zhash : zobrist hash of the board and next_turn, updated incrementally as moves are applied
+    __slots__ = ("board", "width", "height", "next_turn", "zhash")
+    board: Board
     width: int
     height: int
     next_turn: str
+    zhash: int
 
-    def __init__(self, board, next_turn):
+    def __init__(self, board, next_turn, zhash=None):
         self.board = board
         self.next_turn = next_turn
         self.width = WIDTH
         self.height = HEIGHT
+        self.zhash = board.zobrist_hash(next_turn) if zhash is None else zhash
 
     def get_utility(self):
-        """
-        Utility is useful for the player who moves into this state. That is, if the next player in the state is
-        Red/Black, then the player who advanced the game into this state is Black/Red, so the returned utility for this
-        state should be for Black/Red.
-        """
-        # UTILITIES FOR TERMINAL (GAME END) STATES
-        if self.red_win() and self.next_turn == RED_PIECE:  # red win from black's move
-            return MIN_UTILITY  # return min utility so black doesn't pick this state
-        elif self.red_win() and self.next_turn == BLACK_PIECE:  # red win from red's move
-            return MAX_UTILITY  # return max utility so red picks this state and wins
-        elif self.black_win() and self.next_turn == RED_PIECE:  # black win from black's move
-            return MAX_UTILITY  # return max utility so black picks this state and wins
-        elif self.black_win() and self.next_turn == BLACK_PIECE:  # black win from red's move
-            return MIN_UTILITY  # return min utility so red doesn't pick this state
-
-        # ESTIMATED UTILITY FOR NON-TERMINAL STATES
-        (num_pieces_player, num_kings_player, num_center_player, num_advanced_player, num_edge_player,
-         num_can_attack_player) = self._get_evaluation_params(BLACK_PIECE if self.next_turn == RED_PIECE else RED_PIECE)
-
-        (num_pieces_other, num_kings_other, num_center_other, num_advanced_other, num_edge_other,
-         num_can_attack_other) = (self._get_evaluation_params(self.next_turn))
-
-        # CUSTOM EVAL FUNC
-        return ((num_pieces_player + 2 * num_kings_player + 0.5 * num_center_player + 0.15 * num_edge_player) -
-                (num_pieces_other + 2 * num_kings_other + 0.5 * num_center_other + 0.15 * num_edge_other))
-
-    def _get_evaluation_params(self, player):
-        player_piece = player
-        player_king = RED_KING if player == RED_PIECE else BLACK_KING
-        num_pieces, num_kings, num_center, num_advanced, num_edge, num_can_attack = (
-            0, 0, 0, 0, 0, 0)
-
-        for i in range(HEIGHT):
-            for j in range(WIDTH):
-                if self.board[i][j] == player_king:
-                    num_kings += 1
-                if self.board[i][j] == player_piece:
-                    num_pieces += 1
-                if (self.board[i][j] == player_piece or self.board[i][j] == player_king) and ((2 <= i <= 5 and 3 <= j <= 4) or (2 <= j <= 5 and 3 <= i <= 4)):
-                    num_center += 1
-                if (self.board[i][j] == player_piece or self.board[i][j] == player_king) and ((player_piece == RED_PIECE and i <= 3) or (player_piece == BLACK_PIECE and i >= 4)):
-                    num_advanced += 1
-                if ((self.board[i][j] == player_piece or self.board[i][j] == player_king) and
-                        len(self._generate_jump_moves_for_curr(i, j, player_piece)) > 0):
-                    num_can_attack += 1
-                if (self.board[i][j] == player_piece or self.board[i][j] == player_king) and (j == 0 or j == WIDTH - 1):
-                    num_edge += 1
-
-        return num_pieces, num_kings, num_center, num_advanced, num_edge, num_can_attack
+        return get_utility(self.board, self.next_turn)
 
     def red_win(self):
         # red wins <==> there are no black pieces remaining
-        for i in range(HEIGHT):
-            for j in range(WIDTH):
-                if self.board[i][j] == BLACK_PIECE or self.board[i][j] == BLACK_KING:
-                    return False
-        return True
+        return self.board.bm | self.board.bk == 0
 
     def black_win(self):
         # black wins <==> there are no red pieces remaining
-        for i in range(HEIGHT):
-            for j in range(WIDTH):
-                if self.board[i][j] == RED_PIECE or self.board[i][j] == RED_KING:
-                    return False
-        return True
+        return self.board.rm | self.board.rk == 0
 
     def generate_successors(self) -> list[State]:
-        # will only return jump moves, or will only return simple moves
-        jump_moves = self._generate_jump_moves()  # if jumps are possible, consider jumping only
-        return self._generate_simple_moves(self.next_turn) if len(jump_moves) == 0 else jump_moves
-
-    def _generate_jump_moves(self) -> list[State]:
-        next_player_piece = RED_PIECE if self.next_turn == RED_PIECE else BLACK_PIECE
-        next_player_king = RED_KING if self.next_turn == RED_PIECE else BLACK_KING
-
-        successors = []
-        for i in range(HEIGHT):
-            for j in range(WIDTH):
-                if self.board[i][j] == next_player_king or self.board[i][j] == next_player_piece:
-                    successors.extend(self._generate_jump_moves_for_curr(i, j, self.next_turn))
-        return successors
-
-    def _generate_jump_moves_for_curr(self, i, j, turn):
-        next_player_piece = RED_PIECE if turn == RED_PIECE else BLACK_PIECE
-        next_player_king = RED_KING if turn == RED_PIECE else BLACK_KING
-
-        new_board = deepcopy(self.board)
-        if self.board[i][j] == next_player_piece:
-            return self._generate_jump_moves_for_piece(i, j, new_board)
-        elif self.board[i][j] == next_player_king:  # check all 4 diagonals
-            return self._generate_jump_moves_for_king(i, j, new_board)
-
-    def _generate_jump_moves_for_piece(self, i, j, curr_board):
-        next_player_piece = RED_PIECE if self.next_turn == RED_PIECE else BLACK_PIECE
-        piece_moves = {(-1, -1), (-1, 1)} if self.next_turn == RED_PIECE else {(1, -1), (1, 1)}
-        next_player_king = RED_KING if self.next_turn == RED_PIECE else BLACK_KING
-        next_next_player_piece = BLACK_PIECE if self.next_turn == RED_PIECE else RED_PIECE
-        next_next_player_king = BLACK_KING if self.next_turn == RED_PIECE else RED_KING
-
-        successors = []
-
-        # BASE CASE: Nothing to jump over
-        all_empty = True
-        for x, y in piece_moves:
-            if self._can_jump(i + x, j + y, i + x + x, j + y + y, next_next_player_piece, next_next_player_king,
-                              curr_board):
-                all_empty = False
-
-        if all_empty and self.board == curr_board:
-            return []
-        elif all_empty:
-            return [State(curr_board, next_next_player_piece)]
-
-        # RECURSIVE STEP
-        for x, y in piece_moves:
-            if self._can_jump(i + x, j + y, i + x + x, j + y + y, next_next_player_piece, next_next_player_king,
-                              curr_board):
-                new_board = deepcopy(curr_board)
-                new_board[i][j], new_board[i + x][j + y] = EMPTY_SQUARE, EMPTY_SQUARE
-                if (i + x + x == 0 and self.next_turn == RED_PIECE) or (i + x + x == HEIGHT - 1 and
-                                                                        self.next_turn == BLACK_PIECE):
-                    # piece has made it to top/bot ==> become king and end turn
-                    new_board[i + x + x][j + y + y] = next_player_king
-                    successors.append(State(new_board, next_next_player_piece))
-                else:
-                    new_board[i + x + x][j + y + y] = next_player_piece
-                    successors.extend(self._generate_jump_moves_for_piece(i + x + x, j + y + y, new_board))
-        return successors
-
-    def _generate_jump_moves_for_king(self, i, j, curr_board):
-        next_player_king = RED_KING if self.next_turn == RED_PIECE else BLACK_KING
-        next_next_player_piece = BLACK_PIECE if self.next_turn == RED_PIECE else RED_PIECE
-        next_next_player_king = BLACK_KING if self.next_turn == RED_PIECE else RED_KING
-
-        successors = []
-
-        # BASE CASE: Nothing to jump over
-        all_empty = True
-        for x, y in {(-1, -1), (-1, 1), (1, -1), (1, 1)}:
-            if self._can_jump(i + x, j + y, i + x + x, j + y + y, next_next_player_piece, next_next_player_king,
-                              curr_board):
-                all_empty = False
-
-        if all_empty and self.board == curr_board:
-            return []
-        elif all_empty:
-            return [State(curr_board, next_next_player_piece)]
-
-        # RECURSIVE STEP
-        for x, y in {(-1, -1), (-1, 1), (1, -1), (1, 1)}:
-            if self._can_jump(i + x, j + y, i + x + x, j + y + y, next_next_player_piece, next_next_player_king,
-                              curr_board):
-                new_board = deepcopy(curr_board)
-                new_board[i][j], new_board[i + x][j + y] = EMPTY_SQUARE, EMPTY_SQUARE
-                new_board[i + x + x][j + y + y] = next_player_king
-
-                successors.extend(self._generate_jump_moves_for_king(i + x + x, j + y + y, new_board))
-        return successors
-
-    def _can_jump(self, jump_over_y, jump_over_x, jump_to_y, jump_to_x, next_next_player_piece, next_next_player_king,
-                  curr_board) -> bool:
-        """
-        Checks whether we're (1) jumping over and (2) jumping into a square within the grid's bounds, (3) whether the
-        square we're jumping over is occupied by an opponent piece, (4) whether the square we're jumping into is empty
-        """
-        return (0 <= jump_over_y < HEIGHT and 0 <= jump_over_x < WIDTH and 0 <= jump_to_y < HEIGHT
-                and 0 <= jump_to_x < WIDTH and curr_board[jump_to_y][jump_to_x] == EMPTY_SQUARE and
-                (curr_board[jump_over_y][jump_over_x] == next_next_player_piece or
-                 curr_board[jump_over_y][jump_over_x] == next_next_player_king))
-
-    def _generate_simple_moves(self, next_player) -> list[State]:
-        # Pre: the only available moves are simple moves
-        next_player_piece = RED_PIECE if next_player == RED_PIECE else BLACK_PIECE
-        piece_moves = {(-1, -1), (-1, 1)} if next_player == RED_PIECE else {(1, -1), (1, 1)}
-        next_player_king = RED_KING if next_player == RED_PIECE else BLACK_KING
-        next_next_player = BLACK_PIECE if next_player == RED_PIECE else RED_PIECE
-
-        successors = []
-
-        for i in range(HEIGHT):
-            for j in range(WIDTH):
-                if self.board[i][j] == next_player_piece:  # check up left and up right
-                    for x, y in piece_moves:
-                        if 0 <= i + x < HEIGHT and 0 <= j + y < WIDTH and self.board[i + x][j + y] == EMPTY_SQUARE:
-                            new_board = deepcopy(self.board)
-                            new_board[i][j] = EMPTY_SQUARE
-                            if (i + x == 0 and next_player == RED_PIECE) or (i + x == HEIGHT - 1 and
-                                                                             next_player == BLACK_PIECE):
-                                # piece has made it to top/bot ==> become king
-                                new_board[i + x][j + y] = next_player_king
-                            else:
-                                new_board[i + x][j + y] = next_player_piece
-                            successors.append(State(new_board, next_next_player))
-                elif self.board[i][j] == next_player_king:  # check all 4 diagonals
-                    for x, y in {(-1, -1), (-1, 1), (1, -1), (1, 1)}:
-                        if 0 <= i + x < HEIGHT and 0 <= j + y < WIDTH and self.board[i + x][j + y] == EMPTY_SQUARE:
-                            new_board = deepcopy(self.board)
-                            new_board[i][j] = EMPTY_SQUARE
-                            new_board[i + x][j + y] = next_player_king
-                            successors.append(State(new_board, next_next_player))
-        return successors
+        return [State(board, OPP_PIECE[self.next_turn], zhash)
+                for _, _, board, zhash in generate_successors(self.board, self.zhash, self.next_turn)]
 
     def display_test(self):
         print("Next turn:", self.next_turn)
-        for i in self.board:
-            for j in i:
-                print(j, end="")
-            print("")
-        print("")
+        self.display()
 
     def display(self):
-        for i in self.board:
-            for j in i:
-                print(j, end="")
-            print("")
-        print("")
+        # one row of the board per line followed by a blank line, written out in a single call
+        squares = self.board.to_squares().decode("ascii")
+        sys.stdout.write("".join(squares[i:i + WIDTH] + "\n" for i in range(0, WIDTH * HEIGHT, WIDTH)) + "\n")
+
+
+# SEARCH HOT PATH
+# Evaluation and move generation are plain functions of the board bitboards, zobrist hash and turn, so the search
+# does no method dispatch or instance attribute lookups below the State it is handed.
+
+def get_utility(board, next_turn):
+    """
+    Utility is useful for the player who moves into this state. That is, if the next player in the state is
+    Red/Black, then the player who advanced the game into this state is Black/Red, so the returned utility for this
+    state should be for Black/Red.
+    """
+    men, kings, opp_men, opp_kings = board.sides(OPP_PIECE[next_turn])
+    pieces, opp_pieces = men | kings, opp_men | opp_kings
+
+    # UTILITIES FOR TERMINAL (GAME END) STATES
+    if opp_pieces == 0:  # win from the player's move
+        return MAX_UTILITY  # return max utility so the player picks this state and wins
+    elif pieces == 0:  # the player has no pieces left
+        return MIN_UTILITY  # return min utility so the player doesn't pick this state
+
+    # ESTIMATED UTILITY FOR NON-TERMINAL STATES
+    # CUSTOM EVAL FUNC: every piece is worth its type's weight plus the bonus of the square it stands on
+    return ((men.bit_count() - opp_men.bit_count()) +
+            KING_WEIGHT * (kings.bit_count() - opp_kings.bit_count()) +
+            CENTER_WEIGHT * ((pieces & CENTER_MASK).bit_count() - (opp_pieces & CENTER_MASK).bit_count()) +
+            EDGE_WEIGHT * ((pieces & EDGE_MASK).bit_count() - (opp_pieces & EDGE_MASK).bit_count()))
+
+
+def _get_jumpers(board, player) -> int:
+    # bitboard of the player's pieces that have at least one jump available
+    piece_moves = PIECE_DIRS_BY_TURN[player]
+    men, kings, opp_men, opp_kings = board.sides(player)
+    opp_pieces = opp_men | opp_kings
+    empty = FULL_MASK & ~(men | kings | opp_pieces)
+
+    jumpers = 0
+    for direction in KING_DIRS:
+        movers = kings | men if direction in piece_moves else kings
+        jumpers |= _shift(_shift(empty, -direction) & opp_pieces, -direction) & movers
+    return jumpers
+
+
+def generate_successors(board, zhash, next_turn, jumps_only=False) -> list[Move]:
+    # will only return jump moves, or will only return simple moves
+    jump_moves = _generate_jump_moves(board, zhash, next_turn)  # if jumps are possible, consider jumping only
+    if jumps_only:
+        return jump_moves
+    return _generate_simple_moves(board, zhash, next_turn) if len(jump_moves) == 0 else jump_moves
+
+
+def _generate_jump_moves(board, zhash, turn) -> list[Move]:
+    successors = []
+    jumpers = _get_jumpers(board, turn)
+    while jumpers:
+        piece = jumpers & -jumpers
+        successors.extend(_generate_jump_moves_for_curr(_square(piece), board, zhash, turn))
+        jumpers ^= piece
+    return successors
+
+
+def _generate_jump_moves_for_curr(square, board, zhash, turn) -> list[Move]:
+    # Pre: the piece on square has at least one jump available
+    king_row = KING_ROW[turn]
+    men, kings, opp_men, opp_kings = board.sides(turn)
+    men_keys, king_keys, opp_men_keys, opp_king_keys = ZOBRIST_SIDES[turn]
+    is_king = kings >> square & 1 == 1
+    jump_table = KING_JUMPS if is_king else PIECE_JUMPS[turn]  # kings check all 4 diagonals
+
+    successors = []
+
+    # each entry is a jump sequence so far: the square the piece has reached, the board and its hash
+    stack = [(square, men, kings, opp_men, opp_kings, zhash)]
+    while stack:
+        curr, men, kings, opp_men, opp_kings, curr_hash = stack.pop()
+        opp_pieces = opp_men | opp_kings
+        empty = FULL_MASK & ~(men | kings | opp_pieces)
+        piece = 1 << curr
+
+        all_empty = True
+        for jump_over, jump_to in jump_table[curr]:
+            # we can jump if the square we're jumping over holds an opponent piece and the one we land on is empty
+            if (opp_pieces >> jump_over) & (empty >> jump_to) & 1:
+                all_empty = False
+                over_piece, to_piece = 1 << jump_over, 1 << jump_to
+                new_opp_men, new_opp_kings = opp_men & ~over_piece, opp_kings & ~over_piece
+                new_hash = curr_hash ^ (opp_men_keys if over_piece & opp_men else opp_king_keys)[jump_over]
+                if is_king:
+                    stack.append((jump_to, men, kings ^ piece ^ to_piece, new_opp_men, new_opp_kings,
+                                  new_hash ^ king_keys[curr] ^ king_keys[jump_to]))
+                elif to_piece & king_row:
+                    # piece has made it to top/bot ==> become king and end turn
+                    new_board = Board.from_sides(turn, men ^ piece, kings | to_piece, new_opp_men, new_opp_kings)
+                    new_hash ^= men_keys[curr] ^ king_keys[jump_to] ^ ZOBRIST_TURN
+                    successors.append((square, jump_to, new_board, new_hash))
+                else:
+                    stack.append((jump_to, men ^ piece ^ to_piece, kings, new_opp_men, new_opp_kings,
+                                  new_hash ^ men_keys[curr] ^ men_keys[jump_to]))
+
+        # nothing more to jump over, so the sequence ends here (unless no jump was made, i.e. the hash is unchanged)
+        if all_empty and curr_hash != zhash:
+            new_board = Board.from_sides(turn, men, kings, opp_men, opp_kings)
+            successors.append((square, curr, new_board, curr_hash ^ ZOBRIST_TURN))
+    return successors
+
+
+def _generate_simple_moves(board, zhash, next_player) -> list[Move]:
+    # Pre: the only available moves are simple moves
+    piece_moves = PIECE_DIRS_BY_TURN[next_player]
+    king_row = KING_ROW[next_player]
+    men, kings, opp_men, opp_kings = board.sides(next_player)
+    men_keys, king_keys, _, _ = ZOBRIST_SIDES[next_player]
+    empty = FULL_MASK & ~(men | kings | opp_men | opp_kings)
+    curr_hash = zhash ^ ZOBRIST_TURN
+
+    successors = []
+
+    for direction in piece_moves:  # check up left and up right
+        targets = _shift(men, direction) & empty
+        while targets:
+            target = targets & -targets
+            source = _shift(target, -direction)
+            source_square, target_square = _square(source), _square(target)
+            if target & king_row:
+                # piece has made it to top/bot ==> become king
+                new_board = Board.from_sides(next_player, men ^ source, kings | target, opp_men, opp_kings)
+                new_hash = curr_hash ^ men_keys[source_square] ^ king_keys[target_square]
+            else:
+                new_board = Board.from_sides(next_player, men ^ source ^ target, kings, opp_men, opp_kings)
+                new_hash = curr_hash ^ men_keys[source_square] ^ men_keys[target_square]
+            successors.append((source_square, target_square, new_board, new_hash))
+            targets ^= target
+    for direction in KING_DIRS:  # check all 4 diagonals
+        targets = _shift(kings, direction) & empty
+        while targets:
+            target = targets & -targets
+            source = _shift(target, -direction)
+            source_square, target_square = _square(source), _square(target)
+            new_board = Board.from_sides(next_player, men, kings ^ source ^ target, opp_men, opp_kings)
+            new_hash = curr_hash ^ king_keys[source_square] ^ king_keys[target_square]
+            successors.append((source_square, target_square, new_board, new_hash))
+            targets ^= target
+    return successors
 
 
 def get_opp_char(player):
@@ -274,72 +366,162 @@ def read_from_file(filename):
 
     f = open(filename)
     lines = f.readlines()
-    board = [[str(x) for x in l.rstrip()] for l in lines]
+    board = bytearray("".join(l.rstrip() for l in lines), "ascii")
     f.close()
 
     return board
 
 
 class CachedState:
-    def __init__(self, v, depth, successor):
+    __slots__ = ("key", "v", "depth", "successor", "flag")
+
+    def __init__(self, key, v, depth, successor, flag):
+        self.key = key  # full zobrist hash, to tell apart the states sharing a slot
         self.v = v
-        self.depth = depth
+        self.depth = depth  # remaining search depth v was computed with
         self.successor = successor
-
-
-def alphabeta_max_node(state, turn, alpha, beta, current_depth) -> tuple[int, Optional[State]]:
-    state_str = str(state.board) + turn
-    if state_str in cached and cached[state_str].depth >= current_depth:
-        return cached[state_str].v, cached[state_str].successor
-    if current_depth == 0 or state.red_win() or state.black_win():
-        return state.get_utility(), None
-
-    successors = state.generate_successors()
-    if not successors:
-        cached[state_str] = CachedState(MIN_UTILITY, current_depth, None)
-        return MIN_UTILITY, None
-
-    successors.sort(key=lambda s: s.get_utility(), reverse=True)
+        self.flag = flag  # EXACT, LOWER_BOUND or UPPER_BOUND
+
+
+def get_cached(key) -> Optional[CachedState]:
+    entry = cached[key & (CACHE_SIZE - 1)]
+    return entry if entry is not None and entry.key == key else None
+
+
+def store_cached(entry) -> None:
+    # a slot holding another state is only given up to an entry searched at least as deep
+    slot = entry.key & (CACHE_SIZE - 1)
+    old_entry = cached[slot]
+    if old_entry is None or old_entry.key == entry.key or entry.depth >= old_entry.depth:
+        cached[slot] = entry
+
+
+def is_cache_hit(entry, alpha, beta, current_depth) -> bool:
+    # whether a cached entry searched at least as deep settles the value of the state for the window (alpha, beta)
+    if entry is None or entry.depth < current_depth:
+        return False
+    return (entry.flag == EXACT or (entry.flag == LOWER_BOUND and entry.v >= beta) or
+            (entry.flag == UPPER_BOUND and entry.v <= alpha))
+
+
+def get_cache_flag(v, alpha, beta) -> int:
+    # flag for a value searched with the window (alpha, beta)
+    if v <= alpha:
+        return UPPER_BOUND
+    elif v >= beta:
+        return LOWER_BOUND
+    return EXACT
+
+
+def order_successors(successors, entry, current_depth) -> None:
+    """
+    Orders successors in place: the best successor found by an earlier, shallower search of the state first, then the
+    killer moves of this depth, then the rest by their history score. Jumps are forced, so they never compete with
+    simple moves for a place in the order.
+    """
+    best_hash = None if entry is None or entry.successor is None else entry.successor[3]
+    depth_killers = killers[current_depth]
+
+    def score(move):
+        move_from, move_to, _, zhash = move
+        if zhash == best_hash:
+            return MAX_UTILITY
+        elif (move_from, move_to) in depth_killers:
+            return MAX_UTILITY - 1
+        return history.get((move_from, move_to), 0)
+
+    successors.sort(key=score, reverse=True)
+
+
+def record_cutoff(move_from, move_to, current_depth) -> None:
+    # remembers a simple move that caused a cutoff as a killer of its depth, and credits it in the history table
+    if abs(move_from - move_to) not in (WIDTH - 1, WIDTH + 1):  # jump moves are forced, so aren't worth ordering
+        return
+    move = (move_from, move_to)
+    if move not in killers[current_depth]:
+        killers[current_depth] = (move,) + killers[current_depth][:1]
+    history[move] = history.get(move, 0) + current_depth * current_depth
+
+
+def iterative_deepening(state) -> Optional[State]:
+    # searches to depth 1, 2, ..., DEPTH_LIMIT, each depth ordering its moves by the best moves cached by the last
+    best = None
+    for depth in range(1, DEPTH_LIMIT + 1):
+        _, best = alphabeta_max_node(state.board, state.zhash, state.next_turn, MIN_UTILITY, MAX_UTILITY, depth)
+    if best is None:
+        return None
+    _, _, board, zhash = best
+    return State(board, OPP_PIECE[state.next_turn], zhash)
+
+
+def alphabeta_max_node(board, zhash, turn, alpha, beta, current_depth) -> tuple[int, Optional[Move]]:
+    key = zhash  # turn is folded into the hash
+    entry = get_cached(key)
+    if is_cache_hit(entry, alpha, beta, current_depth):
+        return entry.v, entry.successor
+    if current_depth == 0:
+        # QUIESCENCE: past the depth limit, keep searching the (forced) jumps until the position is quiet
+        successors = generate_successors(board, zhash, turn, jumps_only=True)
+        if not successors:
+            # the min player moved into this state, so its utility is negated for the max player
+            return -get_utility(board, turn), None
+    else:
+        successors = generate_successors(board, zhash, turn)
+        if not successors:  # includes the max player having no pieces left
+            store_cached(CachedState(key, MIN_UTILITY, current_depth, None, EXACT))
+            return MIN_UTILITY, None
+
+    order_successors(successors, entry, current_depth)
+    next_turn = OPP_PIECE[turn]
+    alpha_orig, beta_orig = alpha, beta
     v = MIN_UTILITY
     best = successors[0]
     for successor in successors:
-        tempval, _ = alphabeta_min_node(successor, get_next_turn(turn), alpha, beta, current_depth - 1)
+        move_from, move_to, new_board, new_hash = successor
+        tempval, _ = alphabeta_min_node(new_board, new_hash, next_turn, alpha, beta, max(current_depth - 1, 0))
         if tempval > v:
             v = tempval
             best = successor
-        if tempval > beta:
-            cached[state_str] = CachedState(v, current_depth, successor)
-            return v, successor
+        if tempval >= beta:
+            record_cutoff(move_from, move_to, current_depth)
+            break
         alpha = max(alpha, tempval)
-        cached[state_str] = CachedState(v, current_depth, best)
+    store_cached(CachedState(key, v, current_depth, best, get_cache_flag(v, alpha_orig, beta_orig)))
     return v, best
 
 
-def alphabeta_min_node(state, turn, alpha, beta, current_depth) -> tuple[int, Optional[State]]:
-    state_str = str(state.board) + turn
-    if state_str in cached and cached[state_str].depth >= current_depth:
-        return cached[state_str].v, cached[state_str].successor
-    if current_depth == 0 or state.red_win() or state.black_win():
-        return state.get_utility(), None
-
-    successors = state.generate_successors()
-    if not successors:
-        cached[state_str] = CachedState(MAX_UTILITY, current_depth, None)
-        return MAX_UTILITY, None
-
-    successors.sort(key=lambda s: s.get_utility())
+def alphabeta_min_node(board, zhash, turn, alpha, beta, current_depth) -> tuple[int, Optional[Move]]:
+    key = zhash ^ ZOBRIST_MIN_NODE  # turn and node type are folded into the hash
+    entry = get_cached(key)
+    if is_cache_hit(entry, alpha, beta, current_depth):
+        return entry.v, entry.successor
+    if current_depth == 0:
+        # QUIESCENCE: past the depth limit, keep searching the (forced) jumps until the position is quiet
+        successors = generate_successors(board, zhash, turn, jumps_only=True)
+        if not successors:
+            return get_utility(board, turn), None
+    else:
+        successors = generate_successors(board, zhash, turn)
+        if not successors:  # includes the min player having no pieces left
+            store_cached(CachedState(key, MAX_UTILITY, current_depth, None, EXACT))
+            return MAX_UTILITY, None
+
+    order_successors(successors, entry, current_depth)
+    next_turn = OPP_PIECE[turn]
+    alpha_orig, beta_orig = alpha, beta
     v = MAX_UTILITY
     best = successors[0]
     for successor in successors:
-        tempval, _ = alphabeta_max_node(successor, get_next_turn(turn), alpha, beta, current_depth - 1)
+        move_from, move_to, new_board, new_hash = successor
+        tempval, _ = alphabeta_max_node(new_board, new_hash, next_turn, alpha, beta, max(current_depth - 1, 0))
         if tempval < v:
             v = tempval
             best = successor
-        if tempval < alpha:
-            cached[state_str] = CachedState(v, current_depth, successor)
-            return v, successor
+        if tempval <= alpha:
+            record_cutoff(move_from, move_to, current_depth)
+            break
         beta = min(beta, tempval)
-        cached[state_str] = CachedState(v, current_depth, best)
+    store_cached(CachedState(key, v, current_depth, best, get_cache_flag(v, alpha_orig, beta_orig)))
     return v, best
 
 
@@ -361,17 +543,14 @@ if __name__ == '__main__':
     args = parser.parse_args()
 
     initial_board = read_from_file(args.inputfile)
-    state = State(initial_board, RED_PIECE)  # should always be RED_PIECE unless testing
+    state = State(Board.from_squares(initial_board), RED_PIECE)  # should always be RED_PIECE unless testing
 
     sys.stdout = open(args.outputfile, 'w')
 
     state.display()
     # PLAY GAME
     while not (state.red_win() or state.black_win()):
-        if state.next_turn == RED_PIECE:
-            _, state = alphabeta_max_node(state, RED_PIECE, MIN_UTILITY, MAX_UTILITY, DEPTH_LIMIT)
-        else:  # next to move is black
-            _, state = alphabeta_max_node(state, BLACK_PIECE, MIN_UTILITY, MAX_UTILITY, DEPTH_LIMIT)
+        state = iterative_deepening(state)
         state.display()
 
     sys.stdout = sys.__stdout__